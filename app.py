@@ -1,24 +1,62 @@
-import json
+import os
+import orjson
 import pandas as pd
 import streamlit as st
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
-from transformers import pipeline
+
+import sentiment
 
 st.set_page_config(page_title="Brand Reputation Monitor", layout="wide")
 st.title("Brand Reputation Monitor – 2023 Reviews Sentiment")
 
-# ---- load data ----
+# ---- load data (re-read only when the file's mtime changes) ----
+@st.cache_data(show_spinner=False)
+def load_data(path: str, mtime: float) -> dict:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
 try:
-    with open("data.json", "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data_mtime = os.path.getmtime("data.json")
+    data = load_data("data.json", data_mtime)
 except FileNotFoundError:
     st.error("Ni data.json. Najprej zaženi: python scraper.py")
     st.stop()
 
-# ---- load model once ----
+# ---- load model once (only needed when data.json has no stored labels) ----
 @st.cache_resource
 def load_model():
-    return pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+    return sentiment.load_model()
+
+# ---- score once per set of texts (slider revisits are cache hits) ----
+@st.cache_data(show_spinner=False)
+def score(texts: tuple[str, ...]) -> list[str]:
+    return sentiment.predict(load_model(), list(texts)).tolist()
+
+# ---- clean reviews once per data.json version ----
+@st.cache_data(show_spinner=False)
+def clean_reviews(_raw: list, mtime: float) -> pd.DataFrame:
+    reviews = pd.DataFrame(_raw)
+    reviews["date"] = pd.to_datetime(reviews["date"], errors="coerce")
+    reviews["text"] = reviews["text"].fillna("").astype(str)
+    reviews = reviews.dropna(subset=["date"])
+    reviews = reviews[reviews["text"].str.len() > 0].copy()
+    reviews["ym"] = reviews["date"].dt.to_period("M").astype(str)
+    if "sentiment" in reviews.columns:
+        reviews["sentiment"] = pd.Categorical(reviews["sentiment"], categories=sentiment.LABELS)
+    return reviews
+
+# ---- one figure per session, reused across its reruns (matplotlib is not thread-safe) ----
+def plot_counts(pos: int, neg: int, title: str) -> None:
+    if "fig" not in st.session_state:
+        st.session_state["fig"] = plt.subplots()
+    fig, ax = st.session_state["fig"]
+    ax.clear()
+    ax.bar(["Positive", "Negative"], [pos, neg])
+    ax.set_ylabel("Count")
+    ax.set_title(title)
+    st.pyplot(fig, clear_figure=False)
 
 # ---- navigation ----
 section = st.sidebar.radio("Navigate", ["Products", "Testimonials", "Reviews"])
@@ -34,16 +72,12 @@ elif section == "Testimonials":
 else:
     st.subheader("Reviews – Filter by Month (2023) + Sentiment Analysis")
 
-    reviews = pd.DataFrame(data.get("reviews", []))
-    if reviews.empty:
+    if not data.get("reviews"):
         st.warning("Reviews so prazni (data.json nima reviewev).")
         st.stop()
 
-    # clean
-    reviews["date"] = pd.to_datetime(reviews["date"], errors="coerce")
-    reviews["text"] = reviews["text"].fillna("").astype(str)
-    reviews = reviews.dropna(subset=["date"])
-    reviews = reviews[reviews["text"].str.len() > 0]
+    # clean (cached; the "_raw" argument is not hashed, the file mtime is the key)
+    reviews = clean_reviews(data["reviews"], data_mtime)
 
     if reviews.empty:
         st.warning("V data.json ni nobenega veljavnega review-a (datum ali text manjka).")
@@ -52,32 +86,23 @@ else:
     # month picker
     months = [f"2023-{m:02d}" for m in range(1, 13)]
     selected = st.select_slider("Select month (2023)", options=months, value="2023-01")
-    y, m = map(int, selected.split("-"))
 
     # filter
-    month_reviews = reviews[(reviews["date"].dt.year == y) & (reviews["date"].dt.month == m)].copy()
+    month_reviews = reviews[reviews["ym"] == selected].copy()
     st.caption(f"Found **{len(month_reviews)}** reviews in **{selected}**.")
 
     if month_reviews.empty:
         st.info("Za izbran mesec ni reviewev. Izberi drug mesec.")
-        fig, ax = plt.subplots()
-        ax.bar(["Positive", "Negative"], [0, 0])
-        ax.set_ylabel("Count")
-        ax.set_title(f"Positive vs Negative – {selected} (n=0)")
-        st.pyplot(fig)
+        plot_counts(0, 0, f"Positive vs Negative – {selected} (n=0)")
         st.stop()
 
     # sentiment
     st.markdown("### Sentiment Analysis (Hugging Face)")
-    st.write("Model: `distilbert-base-uncased-finetuned-sst-2-english`")
-
-    model = load_model()
-    preds = model(month_reviews["text"].tolist())
+    st.write(f"Model: `{sentiment.MODEL_NAME}`")
 
-    month_reviews["sentiment"] = [
-        "Positive" if p["label"].upper() == "POSITIVE" else "Negative"
-        for p in preds
-    ]
+    # labels are precomputed by scrape_data.py; older data.json files are scored here
+    if "sentiment" not in month_reviews.columns or month_reviews["sentiment"].isna().any():
+        month_reviews["sentiment"] = pd.Categorical(score(tuple(month_reviews["text"])), categories=sentiment.LABELS)
 
     # counts
     pos = int((month_reviews["sentiment"] == "Positive").sum())
@@ -89,11 +114,7 @@ else:
 
     # chart
     st.markdown("### Visualization")
-    fig, ax = plt.subplots()
-    ax.bar(["Positive", "Negative"], [pos, neg])
-    ax.set_ylabel("Count")
-    ax.set_title(f"Positive vs Negative – {selected} (n={len(month_reviews)})")
-    st.pyplot(fig)
+    plot_counts(pos, neg, f"Positive vs Negative – {selected} (n={len(month_reviews)})")
 
     # table
     st.markdown("### Detailed Results")
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import argparse
 import json
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from html import unescape
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urljoin
 
+import orjson
+import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-from dateutil import parser as dateparser
+import xxhash
+from selectolax.lexbor import LexborHTMLParser, LexborNode
+
+import sentiment
 
 BASE = "https://web-scraping.dev"
 OUT_FILE = "data.json"
@@ -25,15 +35,24 @@ SESSION.headers.update(
 
 PRODUCT_ID_RE = re.compile(r"(?:https?://web-scraping\.dev)?/product/(\d+)", re.IGNORECASE)
 PRICE_RE = re.compile(r"\b(\d{1,5}\.\d{2})\b")
+PRODUCT_LINK_RE = re.compile(r'<a[^>]+href="([^"]*?/product/(\d+)[^"]*)"[^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r"<[^>]+>")
+PRICE_TAG_RE = re.compile(r'<[^>]+class="[^"]*\bprice\b[^"]*"[^>]*>([^<]*)', re.IGNORECASE)
+PRICE_SPAN = 3000  # max chars after a product link searched for its price (--fast)
+JSON_SCRIPT_RE = re.compile(r'<script[^>]*type="application/(?:ld\+)?json"[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+JS_ASSIGN_RE = re.compile(r"window\.__\w+\s*=\s*(?=[{\[])")
+
+REVIEW_TEXT_KEYS = ("text", "body", "comment", "review")
+REVIEW_DATE_KEYS = ("date", "created_at", "createdAt", "timestamp")
 
 
-def get_soup(url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> Tuple[BeautifulSoup, str]:
+def get_html(url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> str:
     h = dict(SESSION.headers)
     if headers:
         h.update(headers)
     r = SESSION.get(url, params=params, headers=h, timeout=25)
     r.raise_for_status()
-    return BeautifulSoup(r.text, "html.parser"), r.text
+    return r.text
 
 
 def _extract_price(text: str) -> Optional[str]:
@@ -41,48 +60,107 @@ def _extract_price(text: str) -> Optional[str]:
     return m[-1] if m else None
 
 
-def scrape_products(max_pages: int = 200, sleep_s: float = 0.2) -> List[Dict[str, Any]]:
+def _row_price(a: LexborNode) -> Optional[str]:
+    ancestors: List[LexborNode] = []
+    node = a.parent
+    while node is not None and len(ancestors) < 6:
+        ancestors.append(node)
+        node = node.parent
+
+    # the nearest ".price" element is the product's own; its row text may also hold numbers (sizes, versions)
+    for node in ancestors:
+        price_el = node.css_first(".price")
+        if price_el is not None:
+            price = _extract_price(price_el.text(separator=" ", strip=True))
+            if price:
+                return price
+
+    for node in ancestors:
+        price = _extract_price(node.text(separator=" ", strip=True))
+        if price:
+            return price
+    return None
+
+
+def _price_between(html: str, start: int, end: int) -> Optional[str]:
+    segment = html[start : min(end, start + PRICE_SPAN)]
+    for m in PRICE_TAG_RE.finditer(segment):
+        price = _extract_price(m.group(1))
+        if price:
+            return price
+
+    # no ".price" element: first price in the visible text (never inside src/style/asset URLs)
+    m = PRICE_RE.search(TAG_RE.sub(" ", segment))
+    return m.group(1) if m else None
+
+
+def _parse_products_page(html: str, cat: str, seen_ids: set[str]) -> List[Dict[str, Any]]:
+    # only build a DOM when the page links to at least one product
+    if not PRODUCT_ID_RE.search(html):
+        return []
+
+    items: List[Dict[str, Any]] = []
+    for a in LexborHTMLParser(html).css("a[href]"):
+        href = (a.attributes.get("href") or "").strip()
+        m = PRODUCT_ID_RE.search(href)
+        if not m:
+            continue
+
+        pid = m.group(1)
+        if pid in seen_ids:
+            continue
+
+        name = a.text(separator=" ", strip=True)
+        if not name:
+            continue
+
+        price = _row_price(a)
+        items.append({"id": pid, "name": name, "price": price, "url": urljoin(BASE, href), "category": cat})
+        seen_ids.add(pid)
+
+    return items
+
+
+def _parse_products_page_fast(html: str, cat: str, seen_ids: set[str]) -> List[Dict[str, Any]]:
+    matches = list(PRODUCT_LINK_RE.finditer(html))
+
+    # a product's price lies between its link and the first link to a different product
+    bounds = [len(html)] * len(matches)
+    for i in range(len(matches) - 2, -1, -1):
+        nxt = matches[i + 1]
+        bounds[i] = nxt.start() if nxt.group(2) != matches[i].group(2) else bounds[i + 1]
+
+    items: List[Dict[str, Any]] = []
+    for m, bound in zip(matches, bounds):
+        pid = m.group(2)
+        if pid in seen_ids:
+            continue
+
+        name = " ".join(unescape(TAG_RE.sub(" ", m.group(3))).split())
+        if not name:
+            continue
+
+        href = unescape(m.group(1)).strip()
+        price = _price_between(html, m.end(), bound)
+        items.append({"id": pid, "name": name, "price": price, "url": urljoin(BASE, href), "category": cat})
+        seen_ids.add(pid)
+
+    return items
+
+
+def scrape_products(max_pages: int = 200, sleep_s: float = 0.2, fast: bool = False) -> List[Dict[str, Any]]:
     categories = ["apparel", "consumables"]
     all_products: List[Dict[str, Any]] = []
     seen_ids: set[str] = set()
+    parse_page = _parse_products_page_fast if fast else _parse_products_page
 
     for cat in categories:
         for page in range(1, max_pages + 1):
-            soup, _ = get_soup(urljoin(BASE, "/products"), params={"category": cat, "page": page})
-            anchors = soup.find_all("a", href=True)
-
-            page_items = 0
-            for a in anchors:
-                href = (a.get("href") or "").strip()
-                m = PRODUCT_ID_RE.search(href)
-                if not m:
-                    continue
-
-                pid = m.group(1)
-                if pid in seen_ids:
-                    continue
-
-                name = a.get_text(" ", strip=True)
-                if not name:
-                    continue
-
-                price = None
-                node = a
-                for _ in range(6):
-                    node = getattr(node, "parent", None)
-                    if node is None:
-                        break
-                    txt = node.get_text(" ", strip=True)
-                    price = _extract_price(txt)
-                    if price:
-                        break
-
-                all_products.append(
-                    {"id": pid, "name": name, "price": price, "url": urljoin(BASE, href), "category": cat}
-                )
-                seen_ids.add(pid)
-                page_items += 1
+            html = get_html(urljoin(BASE, "/products"), params={"category": cat, "page": page})
+            page_products = parse_page(html, cat, seen_ids)
+            all_products.extend(page_products)
 
+            page_items = len(page_products)
             print(f"[products:{cat}] page={page} -> {page_items} new (total={len(all_products)})")
             if page_items == 0:
                 break
@@ -106,6 +184,26 @@ def dedupe_products_by_name_price(products: List[Dict[str, Any]]) -> List[Dict[s
     return out
 
 
+def _testimonial_texts(data: Any) -> List[str]:
+    items: List[Any] = []
+    if isinstance(data, dict):
+        for k in ("testimonials", "items", "results", "data"):
+            v = data.get(k)
+            if isinstance(v, list):
+                items = v
+                break
+    elif isinstance(data, list):
+        items = data
+
+    texts: List[str] = []
+    for it in items:
+        if isinstance(it, dict):
+            it = it.get("text") or it.get("comment") or it.get("body") or it.get("testimonial")
+        if isinstance(it, str):
+            texts.append(" ".join(it.split()))
+    return texts
+
+
 def scrape_testimonials(max_pages: int = 200, sleep_s: float = 0.15) -> List[Dict[str, Any]]:
     api_url = urljoin(BASE, "/api/testimonials")
     referer = urljoin(BASE, "/testimonials")
@@ -125,12 +223,20 @@ def scrape_testimonials(max_pages: int = 200, sleep_s: float = 0.15) -> List[Dic
         if r.status_code != 200:
             break
 
-        soup = BeautifulSoup(r.text, "html.parser")
-        main = soup.select_one("main") or soup
-
         candidates: List[str] = []
-        for el in main.select("p, blockquote, li, .testimonial, .testimonial-text"):
-            t = el.get_text(" ", strip=True)
+        texts: Optional[List[str]] = None
+        if "json" in r.headers.get("content-type", ""):
+            try:
+                texts = _testimonial_texts(r.json())
+            except ValueError:
+                pass  # empty or malformed body despite the header: parse it as HTML
+        if texts is None:
+            tree = LexborHTMLParser(r.text)
+            main = tree.css_first("main") or tree
+            nodes = main.css("p, blockquote, li, .testimonial, .testimonial-text")
+            texts = [el.text(separator=" ", strip=True) for el in nodes]
+
+        for t in texts:
             if t and len(t) >= 20:
                 candidates.append(t)
 
@@ -151,41 +257,39 @@ def scrape_testimonials(max_pages: int = 200, sleep_s: float = 0.15) -> List[Dic
     return out
 
 
-def _parse_date(val: Any) -> Optional[datetime]:
-    if val is None:
-        return None
-    if isinstance(val, (int, float)):
-        try:
-            ts = float(val)
-            if ts > 10_000_000_000:
-                ts /= 1000.0
-            return datetime.fromtimestamp(ts, tz=timezone.utc)
-        except Exception:
-            return None
+def _dates_2023(values: List[Any]) -> List[Optional[str]]:
+    # parse all raw dates in one pass -> ISO date for 2023 values, None otherwise
+    raw = pd.Series(values, dtype=object)
+    dates = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns, UTC]")
 
-    s = str(val).strip()
-    if not s:
-        return None
-    try:
-        dt = dateparser.parse(s)
-        if dt is None:
-            return None
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt.astimezone(timezone.utc)
-    except Exception:
-        return None
+    is_num = raw.map(lambda v: isinstance(v, (int, float)))
+    if is_num.any():
+        ts = raw[is_num].astype(float)
+        ts = ts.where(ts <= 10_000_000_000, ts / 1000.0)
+        # epochs pandas cannot represent (e.g. microseconds, garbage) become NaT instead of raising
+        ts = ts.where((ts >= pd.Timestamp.min.timestamp()) & (ts <= pd.Timestamp.max.timestamp()))
+        dates[is_num] = pd.to_datetime(ts, unit="s", utc=True, errors="coerce")
 
+    is_str = ~is_num & raw.notna()
+    if is_str.any():
+        dates[is_str] = pd.to_datetime(raw[is_str].astype(str).str.strip(), utc=True, errors="coerce", format="mixed")
 
-def _keep_only_2023(dt: Optional[datetime]) -> Optional[datetime]:
     # IMPORTANT FIX: do NOT overwrite year
-    if dt is None:
-        return None
-    return dt if dt.year == 2023 else None
+    keep = (dates.dt.year == 2023).tolist()
+    return [d if k else None for d, k in zip(dates.dt.strftime("%Y-%m-%d").tolist(), keep)]
 
 
-def try_fetch_reviews_api(max_pages: int = 200, sleep_s: float = 0.15) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+def _keep_only_2023(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
+    for r, d in zip(rows, _dates_2023([r["date"] for r in rows])):
+        if d is not None:
+            r["date"] = d
+            out.append(r)
+    return out
+
+
+def try_fetch_reviews_api(max_pages: int = 200, sleep_s: float = 0.15) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    raw_items: List[Dict[str, Any]] = []
     headers = {"x-csrf-token": "secret-csrf-token-123"}
 
     for page in range(1, max_pages + 1):
@@ -220,16 +324,10 @@ def try_fetch_reviews_api(max_pages: int = 200, sleep_s: float = 0.15) -> Tuple[
             if not text:
                 continue
 
-            dt = _keep_only_2023(
-                _parse_date(it.get("date") or it.get("created_at") or it.get("createdAt") or it.get("timestamp"))
-            )
-            if dt is None:
-                continue
-
-            out.append(
+            raw_items.append(
                 {
                     "product_id": it.get("product_id") or it.get("productId"),
-                    "date": dt.date().isoformat(),
+                    "date": it.get("date") or it.get("created_at") or it.get("createdAt") or it.get("timestamp"),
                     "text": text,
                     "rating": it.get("rating") or it.get("stars") or it.get("score"),
                     "author": it.get("author") or it.get("user") or it.get("name"),
@@ -238,22 +336,41 @@ def try_fetch_reviews_api(max_pages: int = 200, sleep_s: float = 0.15) -> Tuple[
             )
             added += 1
 
-        print(f"[reviews api] page={page} -> +{added} (total={len(out)})")
+        print(f"[reviews api] page={page} -> +{added} (total={len(raw_items)})")
         time.sleep(sleep_s)
 
+    out = _keep_only_2023(raw_items)
+    print(f"[reviews api] {len(out)} of {len(raw_items)} reviews dated 2023")
     return out, None
 
 
 def extract_json_blobs(html: str) -> List[Any]:
     blobs: List[Any] = []
     decoder = json.JSONDecoder()
+
+    for m in JSON_SCRIPT_RE.finditer(html):
+        try:
+            blobs.append(json.loads(m.group(1)))
+        except ValueError:
+            pass
+    for m in JS_ASSIGN_RE.finditer(html):
+        try:
+            blobs.append(decoder.raw_decode(html, m.end())[0])
+        except ValueError:
+            pass
+    if any(True for b in blobs for _ in _review_lists(b)):
+        return blobs
+
+    # no reviews in the targeted blocks (e.g. only a schema.org Product):
+    # fall back to trying every "{" / "[" in the page, which also covers plain inline scripts
+    blobs = []
     i = 0
     while i < len(html):
         if html[i] in "{[":
             try:
-                obj, end = decoder.raw_decode(html[i:])
+                obj, end = decoder.raw_decode(html, i)
                 blobs.append(obj)
-                i += end
+                i = end
                 continue
             except Exception:
                 pass
@@ -261,72 +378,127 @@ def extract_json_blobs(html: str) -> List[Any]:
     return blobs
 
 
-def _normalize_review_obj(r: Dict[str, Any], product_id: str) -> Optional[Dict[str, Any]]:
-    text = (r.get("text") or r.get("body") or r.get("comment") or r.get("review") or "").strip()
-    if not text:
+def _review_lists(blob: Any) -> Iterator[List[Any]]:
+    if isinstance(blob, dict):
+        for key in ("reviews", "review", "customerReviews"):
+            v = blob.get(key)
+            if isinstance(v, list):
+                yield v
+
+    if isinstance(blob, list) and blob and isinstance(blob[0], dict):
+        sample = blob[0]
+        if any(k in sample for k in REVIEW_DATE_KEYS) and any(k in sample for k in REVIEW_TEXT_KEYS):
+            yield blob
+
+
+def _review_getter(sample: Dict[str, Any]) -> Optional[Callable[[Dict[str, Any]], Tuple[Any, Any]]]:
+    # reviews in one list share a shape: resolve the text/date keys once from the first item
+    text_key = next((k for k in REVIEW_TEXT_KEYS if k in sample), None)
+    date_key = next((k for k in REVIEW_DATE_KEYS if k in sample), None)
+    if text_key is None or date_key is None:
         return None
+    return itemgetter(text_key, date_key)
 
-    dt = _keep_only_2023(
-        _parse_date(r.get("date") or r.get("created_at") or r.get("createdAt") or r.get("timestamp"))
-    )
-    if dt is None:
+
+def _normalize_review_obj(
+    r: Dict[str, Any], product_id: str, getter: Optional[Callable[[Dict[str, Any]], Tuple[Any, Any]]] = None
+) -> Optional[Dict[str, Any]]:
+    text = raw_date = None
+    if getter is not None:
+        try:
+            text, raw_date = getter(r)
+        except KeyError:
+            pass
+    if not text or not raw_date:
+        # item does not match the list's shape
+        text = r.get("text") or r.get("body") or r.get("comment") or r.get("review")
+        raw_date = r.get("date") or r.get("created_at") or r.get("createdAt") or r.get("timestamp")
+
+    text = (text or "").strip()
+    if not text:
         return None
 
-    return {"product_id": product_id, "date": dt.date().isoformat(), "text": text, "source": "product_page"}
+    # date stays raw here; the whole page is parsed and filtered at once by _keep_only_2023()
+    return {"product_id": product_id, "date": raw_date, "text": text, "source": "product_page"}
 
 
-def scrape_reviews_from_product_pages(products_raw: List[Dict[str, Any]], max_products: int = 60, sleep_s: float = 0.15) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    seen: set[tuple[str, str, str]] = set()
+class RateLimiter:
+    # token bucket shared across threads: at most `max_calls` acquisitions per `period_s`
+    def __init__(self, max_calls: int, period_s: float = 1.0) -> None:
+        self._tokens = threading.Semaphore(max_calls)
+        self._period_s = period_s
 
-    for p in products_raw[:max_products]:
-        pid = str(p.get("id") or "").strip()
-        url = p.get("url")
-        if not pid or not url:
-            continue
+    def acquire(self) -> None:
+        self._tokens.acquire()
+        refill = threading.Timer(self._period_s, self._tokens.release)
+        refill.daemon = True
+        refill.start()
 
+
+def scrape_reviews_from_product_pages(
+    products_raw: List[Dict[str, Any]], max_products: int = 60, max_workers: int = 8, max_rps: int = 6
+) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    seen: set[int] = set()  # 64-bit hashes, so long review texts are not kept alive by the set
+    limiter = RateLimiter(max_rps)
+
+    def fetch(url: str) -> str:
+        limiter.acquire()
         r = SESSION.get(url, timeout=25)
         r.raise_for_status()
+        return r.text
 
-        found = 0
-        for b in extract_json_blobs(r.text):
-            if isinstance(b, dict):
-                for key in ("reviews", "review", "customerReviews"):
-                    v = b.get(key)
-                    if isinstance(v, list):
-                        for rr in v:
-                            if isinstance(rr, dict):
-                                norm = _normalize_review_obj(rr, pid)
-                                if norm:
-                                    k = (norm["product_id"], norm["date"], norm["text"])
-                                    if k not in seen:
-                                        seen.add(k)
-                                        out.append(norm)
-                                        found += 1
-
-            if isinstance(b, list) and b and isinstance(b[0], dict):
-                sample = b[0]
-                if any(k in sample for k in ("date", "created_at", "createdAt", "timestamp")) and any(
-                    k in sample for k in ("text", "body", "comment", "review")
-                ):
-                    for rr in b:
+    targets: Dict[str, str] = {}
+    for p in products_raw[:max_products]:
+        pid = str(p.get("id") or "").strip()
+        url = p.get("url")
+        if pid and url:
+            targets[pid] = url
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, url): pid for pid, url in targets.items()}
+        for fut in as_completed(futures):
+            pid = futures[fut]
+            html = fut.result()
+
+            page_reviews: List[Dict[str, Any]] = []
+            for b in extract_json_blobs(html):
+                for reviews in _review_lists(b):
+                    getter = _review_getter(reviews[0]) if reviews and isinstance(reviews[0], dict) else None
+                    for rr in reviews:
                         if isinstance(rr, dict):
-                            norm = _normalize_review_obj(rr, pid)
+                            norm = _normalize_review_obj(rr, pid, getter)
                             if norm:
-                                k = (norm["product_id"], norm["date"], norm["text"])
-                                if k not in seen:
-                                    seen.add(k)
-                                    out.append(norm)
-                                    found += 1
+                                page_reviews.append(norm)
 
-        print(f"[reviews per product] product_id={pid} -> {found}")
-        time.sleep(sleep_s)
+            found = 0
+            for norm in _keep_only_2023(page_reviews):
+                k = xxhash.xxh3_64_intdigest(f"{pid}|{norm['date']}|{norm['text']}".encode())
+                if k not in seen:
+                    seen.add(k)
+                    out.append(norm)
+                    found += 1
+
+            print(f"[reviews per product] product_id={pid} -> {found}")
 
     return out
 
 
-def main() -> None:
-    products_raw = scrape_products()
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=f"Scrape {BASE} into {OUT_FILE}")
+    ap.add_argument(
+        "--fast",
+        action="store_true",
+        help="extract product links with regexes over the raw HTML instead of parsing it",
+    )
+    ap.add_argument(
+        "--no-sentiment",
+        action="store_true",
+        help="skip labelling reviews (no model download; the app then scores them itself)",
+    )
+    args = ap.parse_args(argv)
+
+    products_raw = scrape_products(fast=args.fast)
     products = dedupe_products_by_name_price(products_raw)
     testimonials = scrape_testimonials()
 
@@ -335,6 +507,11 @@ def main() -> None:
         print(f"[reviews] API not usable (status={api_err}). Falling back to product pages...")
         reviews = scrape_reviews_from_product_pages(products_raw)
 
+    if reviews and not args.no_sentiment:
+        labels = sentiment.predict(sentiment.load_model(), [r["text"] for r in reviews], batch_size=64).tolist()
+        for r, label in zip(reviews, labels):
+            r["sentiment"] = label
+
     payload = {
         "meta": {"source": BASE, "scraped_at_utc": datetime.now(timezone.utc).isoformat(timespec="seconds")},
         "products": products,
@@ -342,8 +519,7 @@ def main() -> None:
         "reviews": reviews,
     }
 
-    with open(OUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    Path(OUT_FILE).write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
     print(f"Saved -> {OUT_FILE} | reviews={len(reviews)}")
 
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import numpy as np
+
+# torch / onnxruntime / optimum / transformers are imported inside load_model() and predict(),
+# so browsing pre-labelled data (and importing this module from the scraper) stays light
+MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
+ONNX_DIR = Path(".model_cache") / "distilbert-sst2-int8"
+LABELS = ["Positive", "Negative"]
+MAX_TOKENS = 128  # covers ~99% of short product reviews
+
+
+def load_model() -> Tuple[Any, Any]:
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")  # avoid fork warnings / extra pools under Streamlit reruns
+
+    import torch
+    from onnxruntime import SessionOptions
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    # roughly one thread per physical core; more only causes contention on small hosts
+    n_threads = max(1, (os.cpu_count() or 2) // 2)
+    torch.set_num_threads(n_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # can only be set once per process, before any parallel work
+
+    if torch.cuda.is_available():
+        model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME).to("cuda")
+        return AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True), model.eval()
+
+    # CPU: ONNX export with dynamic int8 quantization, built once and reused from disk
+    quantized = ONNX_DIR / "model_quantized.onnx"
+    if not quantized.exists():
+        ORTModelForSequenceClassification.from_pretrained(MODEL_NAME, export=True).save_pretrained(ONNX_DIR)
+        AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(ONNX_DIR)
+        quantize_dynamic(ONNX_DIR / "model.onnx", quantized, weight_type=QuantType.QInt8)
+
+    opts = SessionOptions()
+    opts.intra_op_num_threads = n_threads
+    opts.inter_op_num_threads = 1
+    model = ORTModelForSequenceClassification.from_pretrained(ONNX_DIR, file_name=quantized.name, session_options=opts)
+    return AutoTokenizer.from_pretrained(ONNX_DIR, use_fast=True), model
+
+
+def predict(model: Tuple[Any, Any], texts: List[str], batch_size: int = 32) -> np.ndarray:
+    import torch
+
+    tokenizer, clf = model
+    # batch reviews of similar length together so little compute is spent on padding
+    order = np.argsort([len(t.split()) for t in texts], kind="stable")
+    positive = np.zeros(len(texts), dtype=bool)
+    for i in range(0, len(texts), batch_size):
+        idx = order[i : i + batch_size]
+        enc = tokenizer(
+            [texts[j] for j in idx], padding=True, truncation=True, max_length=MAX_TOKENS, return_tensors="pt"
+        ).to(clf.device)
+        with torch.inference_mode():
+            logits = clf(**enc).logits
+        # SST-2 head: index 0 = NEGATIVE, 1 = POSITIVE
+        positive[idx] = (logits[:, 1] > logits[:, 0]).cpu().numpy()
+    return np.where(positive, *LABELS)